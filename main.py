@@ -1,47 +1,171 @@
 #!/usr/bin/env python3
 import os
 import io
+import json
 import re
-import zipfile
-import base64
-import imghdr
+import time
 import logging
 import asyncio
-import json
+import sys
+import threading
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from itertools import islice
 from typing import Counter, Optional, Dict, List
 
 import httpx
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import PlainTextResponse
+import orjson
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response
 from lxml import etree, html as lxml_html
-from io import StringIO
 
 TIKA_SERVER = os.environ.get("TIKA_SERVER", "http://localhost:9998")
 UNPACK_PATH = "/unpack/all"  # only endpoint needed for current tika version
+# bounded LRU cache of converted markdown, keyed by a digest of the uploaded body (0 disables)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "128"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# concurrent requests allowed to talk to Tika at once; further requests wait their turn
+MAX_INFLIGHT = int(os.environ.get("MAX_INFLIGHT", "8"))
+UPLOAD_CHUNK_SIZE = 64 * 1024
 logger = logging.getLogger("tika-fastapi")
 logger.setLevel(logging.INFO)
 
-app = FastAPI(title="Tika HTML->Markdown Inliner")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Share one pooled Tika client across requests so connections are kept alive and reused."""
+    app.state.tika_semaphore = asyncio.Semaphore(MAX_INFLIGHT)
+    app.state.tika_client = httpx.AsyncClient(
+        base_url=TIKA_SERVER,
+        timeout=httpx.Timeout(60.0),
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+    try:
+        yield
+    finally:
+        await app.state.tika_client.aclose()
+
+
+app = FastAPI(title="Tika HTML->Markdown Inliner", lifespan=lifespan)
+
+# Pre-compiled regular expressions used on the hot paths
+# numeric NUL references (decimal and hex)
+_NUL_REF_RE = re.compile(r'&#0+;|&#x0+;?', re.I)
+# control characters except \t (09), \n (0A), \r (0D); deletion table for str.translate plus a regex
+# for non-ASCII strings, where translate falls back to a slow per-character path
+_CTRL_CHARS = [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20)]
+_CTRL_DEL = dict.fromkeys(_CTRL_CHARS, None)
+_CTRL_RE = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F]')
+_WS_RE = re.compile(r'\s+')
+_NONWORD_RE = re.compile(r'[\s\W_]+')
+_SENT_SPLIT_RE = re.compile(r'(?<=[。\.!?！？])\s*')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+_TITLE_RE = re.compile(r'<title\b[^>]*>.*?</title\s*>', re.I | re.S)
+
+# Pre-compiled XPath expressions for class predicates; plain tag lookups use Element.iter()
+# instead, which avoids the XPath engine and the document-order sort of union expressions.
+# Classes are matched as whole tokens, so e.g. "subpage-item" or "pageless" are not pages.
+_XP_PACKAGE = etree.XPath(".//*[contains(concat(' ', normalize-space(@class), ' '), ' package-entry ')]")
+_XP_PAGE = etree.XPath(".//*[contains(concat(' ', normalize-space(@class), ' '), ' page ')]")
+# text-bearing tags scanned per page by remove_page_header_footer_repeats
+_PAGE_TEXT_TAGS = ("p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "span")
+
+# lxml parsers keep state between parses and must not be used by two threads at once; documents are
+# parsed in worker threads, so each thread lazily builds and reuses its own (see _html_parser)
+_PARSER_LOCAL = threading.local()
+
+_RESULT_CACHE: "OrderedDict[bytes, str]" = OrderedDict()
+_result_cache_bytes = 0
+
+
+async def _hash_upload(file: UploadFile):
+    """Return (cache key, size) of an upload, reading it in chunks and rewinding it afterwards.
+    The key is a 16-byte blake2b digest of the full body, computed without holding the body in memory.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    await file.seek(0)
+    return digest.digest(), size
+
+
+async def _iter_upload(file: UploadFile):
+    """Yield an upload in chunks, so it can be streamed to Tika instead of read into one bytes object."""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _cache_get(key: bytes) -> Optional[str]:
+    markdown = _RESULT_CACHE.get(key)
+    if markdown is not None:
+        _RESULT_CACHE.move_to_end(key)
+    return markdown
+
+
+def _cache_put(key: bytes, markdown: str):
+    """Store markdown for key, evicting least recently used entries past the count/size bounds."""
+    global _result_cache_bytes
+    size = sys.getsizeof(markdown)
+    if RESULT_CACHE_SIZE <= 0 or size > RESULT_CACHE_MAX_BYTES:
+        return
+    old = _RESULT_CACHE.pop(key, None)
+    if old is not None:
+        _result_cache_bytes -= sys.getsizeof(old)
+    _RESULT_CACHE[key] = markdown
+    _result_cache_bytes += size
+    while len(_RESULT_CACHE) > RESULT_CACHE_SIZE or _result_cache_bytes > RESULT_CACHE_MAX_BYTES:
+        _, evicted = _RESULT_CACHE.popitem(last=False)
+        _result_cache_bytes -= sys.getsizeof(evicted)
+
+
+def _html_parser() -> etree.HTMLParser:
+    """Return this thread's HTML parser, creating it on first use.
+    huge_tree stays on since Tika output for large documents exceeds libxml2's default limits.
+    Comments and PIs are dropped at parse time (their tail text is kept), and id() lookups are
+    never used, so the id table is not built.
+    """
+    parser = getattr(_PARSER_LOCAL, "parser", None)
+    if parser is None:
+        parser = _PARSER_LOCAL.parser = etree.HTMLParser(
+            recover=True, huge_tree=True, remove_comments=True, remove_pis=True, collect_ids=False
+        )
+    return parser
 
 
 def _ensure_etree(html_or_etree):
     """Return an lxml etree. If given an etree already, return it.
-    Use lxml parser for speed when parsing strings.
+    Use lxml parser for speed when parsing strings. Input that yields no elements (blank, or only
+    comments/PIs, which the parser drops) becomes an empty document.
     """
     if isinstance(html_or_etree, etree._Element):
         return html_or_etree
     html = html_or_etree or ""
-    parser = etree.HTMLParser(recover=True, huge_tree=True)
-    try:
-        # Use forgiving parser that allows huge trees and recovers from malformation
-        return lxml_html.fromstring(html, parser=parser)
-    except Exception:
-        # Fallback for malformed HTML
+    parser = _html_parser()
+    if html[:64].lstrip().startswith("<?xml"):
+        # lxml refuses str input carrying an XML declaration (its encoding no longer applies)
+        end = html.find("?>")
+        html = html[end + 2:] if end != -1 else ""
+    root = None
+    if html and not html.isspace():
         try:
-            return lxml_html.fragment_fromstring(html, parser=parser)
-        except Exception:
-            # Last resort: create empty document
-            return lxml_html.fromstring("<html><body></body></html>", parser=parser)
+            # forgiving parser that allows huge trees and recovers from malformation; parse straight
+            # into the document root (etree.HTML) rather than through lxml.html.fromstring's
+            # document/fragment detection, which re-scans the input in Python first
+            root = etree.fromstring(html, parser)
+        except etree.LxmlError:
+            logger.exception("failed to parse HTML; using an empty document")
+    if root is None:
+        root = lxml_html.fromstring("<html><body></body></html>", parser=parser)
+    return root
 
 
 def sanitize_html(html: str) -> etree._Element:
@@ -50,54 +174,67 @@ def sanitize_html(html: str) -> etree._Element:
     Returns lxml etree element.
     """
     if not html:
-        return lxml_html.fromstring("<html><body></body></html>")
+        return lxml_html.fromstring("<html><body></body></html>", parser=_html_parser())
 
     # Remove explicit numeric NUL references (decimal and hex)
-    html = re.sub(r'(?i)&#0+;|&#x0+;?', '', html)
+    html = _NUL_REF_RE.sub('', html)
 
     # Remove control characters except \t (09), \n (0A), \r (0D)
-    html = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F]', '', html)
+    html = html.translate(_CTRL_DEL) if html.isascii() else _CTRL_RE.sub('', html)
+
+    # Drop <title> elements before parsing; cheaper than a tree search on large documents
+    html = _TITLE_RE.sub('', html)
 
     return _ensure_etree(html)
 
 
-async def fetch_rmeta(client: httpx.AsyncClient, body: bytes, timeout: int = 60):
+async def fetch_rmeta(client: httpx.AsyncClient, body, timeout: int = 60, content_length: Optional[int] = None):
     """
     Fetch structured metadata records from Tika's /rmeta endpoint.
-    Returns (main_content_html, embedded_records_list).
-    - main_content_html: the X-TIKA:content from the first record (if present), sanitized
+    `body` is the document as bytes or an async iterator of byte chunks; pass content_length with
+    the latter so the upload is sent with a Content-Length rather than chunked.
+    Returns (main_content_html, page_size, embedded_records_list).
+    - main_content_html: the X-TIKA:content from the first record (if present), sanitized;
+      None when no record could be decoded from the response
     - embedded_records_list: any remaining parsed records (attachments/embedded resources metadata)
     """
-    url = TIKA_SERVER.rstrip("/") + "/rmeta"
     headers = {
         "Accept": "application/json",
     }
+    if content_length is not None:
+        headers["Content-Length"] = str(content_length)
 
-    resp = await client.put(url, content=body, headers=headers, timeout=timeout)
+    # client is created with base_url=TIKA_SERVER
+    resp = await client.put("/rmeta", content=body, headers=headers, timeout=timeout)
     resp.raise_for_status()
-    text = resp.text
 
     records = []
     try:
-        parsed = resp.json()
+        # decode straight from the raw bytes; resp.text/resp.json() would decode the payload twice
+        try:
+            parsed = orjson.loads(resp.content)
+        except orjson.JSONDecodeError:
+            # orjson rejects some input the stdlib accepts, e.g. unpaired surrogate escapes in the text
+            parsed = json.loads(resp.content)
         if isinstance(parsed, list):
             records = parsed
         elif isinstance(parsed, dict):
             records = [parsed]
     except Exception:
-        # fallback: try parse as ndjson (one json object per line)
-        for line in text.splitlines():
+        # fallback: try parse as ndjson (one json object per line); split the raw bytes, orjson takes
+        # them directly, so the body is not decoded into a second full-size str first
+        for line in resp.content.splitlines():
             line = line.strip()
             if not line:
                 continue
             try:
-                obj = json.loads(line)
+                obj = orjson.loads(line)
                 records.append(obj)
             except Exception:
                 # skip non-json lines
                 continue
 
-    main_content = ""
+    main_content = None
     page_size = 0
     embedded = []
     if records:
@@ -127,10 +264,10 @@ def _extract_sentence_fragment(text: str, which: str = "last", max_len: int = 20
     if not text:
         return ""
     # normalize whitespace
-    s = re.sub(r'\s+', ' ', text).strip()
+    s = _WS_RE.sub(' ', text).strip()
     # split preserving sentence terminators
-    parts = re.split(r'(?<=[。\.!?！？])\s*', s)
-    parts = [p.strip() for p in parts if p.strip()]
+    parts = _SENT_SPLIT_RE.split(s)
+    parts = [p for p in (p.strip() for p in parts) if p]
     if not parts:
         fragment = s
     else:
@@ -152,8 +289,8 @@ def _get_text_content(element):
     if element is None:
         return ""
 
-    # Prefer visible text nodes
-    text = "".join(element.itertext()).strip()
+    # Prefer visible text nodes; the text serializer gathers them in C instead of joining itertext()
+    text = etree.tostring(element, method="text", encoding="unicode", with_tail=False).strip()
     if text:
         return text
 
@@ -166,9 +303,8 @@ def _get_text_content(element):
             return alt if alt else "[image]"
 
         # otherwise look for descendant imgs (prefer the first/closest)
-        imgs = element.xpath(".//img") if hasattr(element, "xpath") else []
-        if imgs:
-            first = imgs[0]
+        first = next(element.iterdescendants("img"), None)
+        if first is not None:
             alt = (first.get("alt") or first.get("title") or first.get("src") or "").strip()
             return alt if alt else "[image]"
     except Exception:
@@ -177,59 +313,101 @@ def _get_text_content(element):
     return ""
 
 
-def _gather_text_from_previous(img_tag, max_ancestors: int = 4) -> str:
-    """Gather meaningful text from previous siblings/ancestors using lxml"""
-    current = img_tag.getprevious()
-    while current is not None:
-        text = _get_text_content(current)
-        if text and not re.fullmatch(r'[\s\W_]+', text):
-            return text
-        current = current.getprevious()
-    
-    # Check ancestors
-    parent = img_tag.getparent()
-    ancestors_checked = 0
-    while parent is not None and ancestors_checked < max_ancestors:
-        prev_sibling = parent.getprevious()
-        while prev_sibling is not None:
-            text = _get_text_content(prev_sibling)
-            if text and not re.fullmatch(r'[\s\W_]+', text):
+def _first_meaningful_text(element, limit: int = 200) -> str:
+    """Leading text of an element, read lazily with itertext().
+    Stops once the normalized prefix is longer than `limit` and holds a word character, which is all
+    first-sentence extraction (max 120 chars) needs; a large following block is not joined in full.
+    Empty elements fall back to _get_text_content so image-only blocks still yield their alt text.
+    """
+    if element is None or not isinstance(element.tag, str):
+        return _get_text_content(element)
+    parts = []
+    size = 0
+    check_at = limit
+    for t in element.itertext():
+        parts.append(t)
+        size += len(t)
+        if size > check_at:
+            text = "".join(parts).strip()
+            if len(_normalize_text(text)) > limit and not _NONWORD_RE.fullmatch(text):
                 return text
-            prev_sibling = prev_sibling.getprevious()
-        parent = parent.getparent()
-        ancestors_checked += 1
-    
+            check_at = size * 2
+    text = "".join(parts).strip()
+    return text if text else _get_text_content(element)
+
+
+def _prev_sibling_text(element, texts: Optional[dict] = None) -> str:
+    """First meaningful text among element's previous siblings, nearest first.
+    Sibling texts are memoized in `texts` (keyed by element) when given.
+    """
+    is_noise = _NONWORD_RE.fullmatch  # local alias for the per-sibling checks below
+    for sibling in element.itersiblings(preceding=True):
+        if texts is None:
+            text = _get_text_content(sibling)
+        else:
+            text = texts.get(sibling)
+            if text is None:
+                text = texts[sibling] = _get_text_content(sibling)
+        if text and not is_noise(text):
+            return text
     return ""
 
 
-def _gather_text_from_next(img_tag, max_ancestors: int = 4) -> str:
-    """Gather meaningful text from next siblings/ancestors using lxml"""
-    current = img_tag.getnext()
-    while current is not None:
-        text = _get_text_content(current)
-        if text and not re.fullmatch(r'[\s\W_]+', text):
+def _next_sibling_text(element) -> str:
+    """First meaningful text among element's next siblings, nearest first.
+    Only the first sentence is used, so sibling text is read lazily via _first_meaningful_text.
+    """
+    is_noise = _NONWORD_RE.fullmatch  # local alias for the per-sibling checks below
+    for sibling in element.itersiblings():
+        text = _first_meaningful_text(sibling)
+        if text and not is_noise(text):
             return text
-        current = current.getnext()
-    
-    # Check ancestors
-    parent = img_tag.getparent()
-    ancestors_checked = 0
-    while parent is not None and ancestors_checked < max_ancestors:
-        next_sibling = parent.getnext()
-        while next_sibling is not None:
-            text = _get_text_content(next_sibling)
-            if text and not re.fullmatch(r'[\s\W_]+', text):
-                return text
-            next_sibling = next_sibling.getnext()
-        parent = parent.getparent()
-        ancestors_checked += 1
-    
     return ""
 
 
-def _build_title_from_context(img_tag) -> str:
-    prev_text = _gather_text_from_previous(img_tag)
-    next_text = _gather_text_from_next(img_tag)
+def _gather_context_text(img_tag, max_ancestors: int = 4, prev_cache: Optional[dict] = None, next_cache: Optional[dict] = None, texts: Optional[dict] = None):
+    """Gather meaningful text before and after an img from its siblings, then its ancestors' siblings.
+    Returns (prev_text, next_text). Both directions share one ancestor climb, which stops once each
+    side has text or max_ancestors levels were checked.
+    The climb only depends on the img's parent, so its results are memoized in prev_cache/next_cache
+    (keyed by parent element) when given; images sharing a parent reuse them. `texts` memoizes
+    the full text of preceding siblings (see _prev_sibling_text).
+    """
+    prev_text = _prev_sibling_text(img_tag, texts)
+    next_text = _next_sibling_text(img_tag)
+    if prev_text and next_text:
+        return prev_text, next_text
+
+    first_parent = img_tag.getparent()
+    need_prev = not prev_text
+    need_next = not next_text
+    if need_prev and prev_cache is not None and first_parent in prev_cache:
+        prev_text = prev_cache[first_parent]
+        need_prev = False
+    if need_next and next_cache is not None and first_parent in next_cache:
+        next_text = next_cache[first_parent]
+        need_next = False
+    if not (need_prev or need_next):
+        return prev_text, next_text
+
+    # Check ancestors
+    for parent in islice(img_tag.iterancestors(), max_ancestors):
+        if need_prev and not prev_text:
+            prev_text = _prev_sibling_text(parent, texts)
+        if need_next and not next_text:
+            next_text = _next_sibling_text(parent)
+        if (prev_text or not need_prev) and (next_text or not need_next):
+            break
+
+    if need_prev and prev_cache is not None:
+        prev_cache[first_parent] = prev_text
+    if need_next and next_cache is not None:
+        next_cache[first_parent] = next_text
+    return prev_text, next_text
+
+
+def _build_title_from_context(img_tag, prev_cache: Optional[dict] = None, next_cache: Optional[dict] = None, texts: Optional[dict] = None) -> str:
+    prev_text, next_text = _gather_context_text(img_tag, prev_cache=prev_cache, next_cache=next_cache, texts=texts)
 
     prev_frag = _extract_sentence_fragment(prev_text, which="last", max_len=120) if prev_text else ""
     next_frag = _extract_sentence_fragment(next_text, which="first", max_len=120) if next_text else ""
@@ -247,26 +425,37 @@ def _build_title_from_context(img_tag) -> str:
     return title.strip().replace("\n", " ")
 
 
-def inline_images_in_html(tree):
+def inline_images_in_html(tree: etree._Element, imgs: Optional[list] = None):
     """
     Process img tags in lxml etree to generate alt text from context.
     Only generates alt text, doesn't actually inline images for performance.
+    `imgs` may be passed in when already collected (see _collect_nodes).
     Returns the modified tree.
     """
-    tree = _ensure_etree(tree)
-    
-    # Find all img elements using xpath
-    imgs = tree.xpath(".//img")
+    # Find all img elements
+    if imgs is None:
+        imgs = list(tree.iter("img"))
+    if not imgs:
+        return tree
 
+    # per-parent memo of the ancestor context walks, shared by sibling images, and per-element memo of
+    # sibling texts, so a row of images does not re-read the same neighbours for every image
+    prev_cache = {}
+    next_cache = {}
+    texts = {}
     for img in imgs:
-        alt_text = _build_title_from_context(img)
+        alt_text = _build_title_from_context(img, prev_cache, next_cache, texts)
         if alt_text:
             img.set("alt", alt_text)
 
         # Remove title attribute if present
         if "title" in img.attrib:
             del img.attrib["title"]
-    
+
+        # alt/title feed the image fallback of _get_text_content for the img and its ancestors
+        texts.pop(img, None)
+        _evict_ancestors(img, texts)
+
     return tree
 
 
@@ -277,89 +466,155 @@ _FILENAME_RE = re.compile(r'^_?\d{6,}\.\w+$|^[\w\-. ]{1,40}\.\w{1,6}$', re.I)
 def _normalize_text(s: str) -> str:
     if not s:
         return ""
-    return re.sub(r'\s+', ' ', s).strip()
+    return _WS_RE.sub(' ', s).strip()
 
 
-def remove_non_content_blocks(tree, min_header_repeat: int = 3, min_package_group: int = 2, tail_scan_limit: int = 20, max_header_text_len: int = 200):
+def _cached_text(element, cache: dict) -> str:
+    """Normalized text content of element, memoized per element for one pass.
+    Callers detaching an element must evict its ancestors with _evict_ancestors.
+    """
+    txt = cache.get(element)
+    if txt is None:
+        txt = cache[element] = _normalize_text(_get_text_content(element))
+    return txt
+
+
+def _bounded_text(element, limit: int = 200) -> str:
+    """Normalized text content of element, or "" once it is known to be longer than `limit`.
+    For length-capped header/footer checks: itertext() is read lazily, so a large block is rejected
+    after roughly `limit` characters instead of being serialized in full.
+    """
+    if not len(element):
+        # leaf: its own text is the whole text content
+        txt = _normalize_text(element.text)
+        if not txt:
+            txt = _normalize_text(_get_text_content(element))
+        return txt if len(txt) <= limit else ""
+    parts = []
+    size = 0
+    check_at = limit
+    for t in element.itertext():
+        parts.append(t)
+        size += len(t)
+        if size > check_at:
+            if len(_normalize_text("".join(parts))) > limit:
+                return ""
+            check_at = size * 2
+    txt = _normalize_text("".join(parts))
+    if not txt:
+        # image-only blocks fall back to their alt/title/src like _get_text_content
+        txt = _normalize_text(_get_text_content(element))
+    return txt if len(txt) <= limit else ""
+
+
+def _cached_bounded_text(element, cache: dict, limit: int) -> str:
+    """_bounded_text memoized per element for one pass; see _cached_text for eviction."""
+    txt = cache.get(element)
+    if txt is None:
+        txt = cache[element] = _bounded_text(element, limit)
+    return txt
+
+
+def _evict_ancestors(element, cache: dict):
+    for ancestor in element.iterancestors():
+        cache.pop(ancestor, None)
+
+
+def _detach_all(elements, cache: Optional[dict] = None) -> int:
+    """Detach elements from their parents in one go, after the caller has decided on all of them.
+    Their ancestors are evicted from `cache` (see _cached_text) when one is given. Elements already
+    detached are skipped; descendants of an earlier entry just leave the detached subtree.
+    Returns the number of elements detached.
+    """
+    removed = 0
+    for element in elements:
+        parent = element.getparent()
+        if parent is None:
+            continue
+        if cache is not None:
+            _evict_ancestors(element, cache)
+        parent.remove(element)
+        removed += 1
+    return removed
+
+
+def _is_attached(element, root) -> bool:
+    """Whether element is still inside root's tree (not in a subtree detached by an earlier stage)."""
+    top = element
+    for top in element.iterancestors():
+        pass
+    return top is root
+
+
+def remove_non_content_blocks(tree: etree._Element, min_header_repeat: int = 3, min_package_group: int = 2, tail_scan_limit: int = 20, max_header_text_len: int = 200, packages: Optional[list] = None):
     """
     Remove attachment-like / repeated header / tail filename-list blocks from HTML using lxml.
+    `packages` may be passed in when already collected (see _collect_nodes); entries detached
+    since then are ignored.
     Returns the modified tree.
     """
-    tree = _ensure_etree(tree)
     if tree is None:
         return tree
 
     try:
         # Get body or use tree itself
-        body_elements = tree.xpath(".//body")
-        body = body_elements[0] if body_elements else tree
+        body = next(tree.iter("body"), None)
+        if body is None:
+            body = tree
+        if not len(body):
+            return tree
+        texts = {}
 
         # 1) package-entry handling - find elements with class containing 'package-entry'
         package_tags = []
-        for element in tree.xpath(".//*[contains(@class, 'package-entry')]"):
+        if packages is None:
+            packages = _XP_PACKAGE(tree)
+        else:
+            packages = [element for element in packages if _is_attached(element, tree)]
+        for element in packages:
             txt = ""
             # Look for h1, h2, h3 first
-            headers = element.xpath(".//h1 | .//h2 | .//h3")
-            if headers:
-                txt = _normalize_text(_get_text_content(headers[0]))
+            # filenames are short, so longer text is rejected without reading it in full
+            header = next(element.iterdescendants("h1", "h2", "h3"), None)
+            if header is not None:
+                txt = _bounded_text(header, max_header_text_len)
             else:
-                txt = _normalize_text(_get_text_content(element))
+                txt = _bounded_text(element, max_header_text_len)
             
             if txt and _FILENAME_RE.match(txt):
                 package_tags.append((element, txt))
 
-        if len(package_tags) >= min_package_group:
+        remove_packages = len(package_tags) >= min_package_group
+        if not remove_packages and package_tags:
+            # Check if package tags are concentrated at document tail: every tail child must be
+            # a package entry or contain one, i.e. be in the ancestor-or-self set of the entries
+            holders = set()
             for element, _ in package_tags:
-                try:
-                    parent = element.getparent()
-                    if parent is not None:
-                        logger.warn("Removing package-entry element: %r", element)
-                        parent.remove(element)
-                except Exception:
-                    pass
-        else:
-            # Check if package tags are concentrated at document tail
-            if package_tags:
-                all_children = list(body)
-                tail_children = all_children[-tail_scan_limit:] if len(all_children) > tail_scan_limit else all_children
-                concentrated = all(
-                    any(element == child or element in child.iter() for element, _ in package_tags)
-                    for child in tail_children
-                )
-                if concentrated:
-                    for element, _ in package_tags:
-                        try:
-                            parent = element.getparent()
-                            if parent is not None:
-                                logger.warn("Removing package-entry element: %r", element)
-                                parent.remove(element)
-                        except Exception:
-                            pass
+                holders.add(element)
+                holders.update(element.iterancestors())
+            tail_children = body[-tail_scan_limit:]
+            remove_packages = all(child in holders for child in tail_children)
+
+        if remove_packages:
+            for element, _ in package_tags:
+                logger.warning("Removing package-entry element: %r", element)
+            _detach_all([element for element, _ in package_tags], texts)
 
         # 3) remove trailing nodes that look like comma/space separated filenames
-        body_children = list(body)
         for _ in range(3):
-            if not body_children:
+            if not len(body):
                 break
-            last = body_children[-1]
-            txt = _normalize_text(_get_text_content(last))
+            last = body[-1]
+            txt = _cached_text(last, texts)
             if not txt:
-                try:
-                    parent = last.getparent()
-                    if parent is not None:
-                        logger.warn("Removing trailing element: %r", last)
-                        parent.remove(last)
-                        body_children.pop()
-                except Exception:
-                    pass
-                continue
+                logger.warn("Removing trailing element: %r", last)
+                _evict_ancestors(last, texts)
+                body.remove(last)
 
         # 4) repeated header detection among top-level children
-        top_children = list(body)
-        consider_top_n = min(8, len(top_children))
         candidates = []
-        for child in top_children[:consider_top_n]:
-            txt = _normalize_text(_get_text_content(child))
+        for child in body[:8]:
+            txt = _cached_text(child, texts)
             if txt and len(txt) <= max_header_text_len:
                 candidates.append(txt)
                 
@@ -367,17 +622,27 @@ def remove_non_content_blocks(tree, min_header_repeat: int = 3, min_package_grou
             counts = Counter(candidates)
             repeated = {t for t, cnt in counts.items() if cnt >= min_header_repeat}
             if repeated:
-                for tag in tree.iter():
-                    if hasattr(tag, 'tag'):  # Make sure it's an element, not a comment/text
-                        txt = _normalize_text(_get_text_content(tag))
-                        if txt in repeated:
-                            try:
-                                parent = tag.getparent()
-                                if parent is not None:
-                                    logger.warning("Removing repeated header/footer element: %s %r", txt, tag)
-                                    parent.remove(tag)
-                            except Exception:
-                                pass
+                # Collect matches in one document-order walk, skipping the subtree of each match
+                # (it goes away with it), then detach them; removing while iterating would end
+                # the walk at the first removed element.
+                # A descendant's normalized text is a substring of its ancestor's, so subtrees whose
+                # text contains no repeated string are skipped too, unless they hold an <img> whose
+                # alt text could stand in for an empty descendant's text.
+                # Texts longer than every repeated string cannot match; checking the length first
+                # keeps large block texts out of the set lookup, which would hash them in full.
+                longest = max(map(len, repeated))
+                matches = []
+                walker = etree.iterwalk(tree, events=("start",), tag="*")
+                for _, tag in walker:
+                    txt = _cached_text(tag, texts)
+                    if len(txt) <= longest and txt in repeated:
+                        matches.append((tag, txt))
+                        walker.skip_subtree()
+                    elif not any(r in txt for r in repeated) and next(tag.iter("img"), None) is None:
+                        walker.skip_subtree()
+                for tag, txt in matches:
+                    logger.warning("Removing repeated header/footer element: %s %r", txt, tag)
+                _detach_all([tag for tag, _ in matches])
 
         return tree
     except Exception as e:
@@ -385,67 +650,50 @@ def remove_non_content_blocks(tree, min_header_repeat: int = 3, min_package_grou
         return tree
 
 
-def normalize_tables_use_first_row_as_header(tree):
+def normalize_tables_use_first_row_as_header(tree: etree._Element, tables: Optional[list] = None):
     """
     For tables that lack any <th>, take the first <tr> as header using lxml.
+    `tables` may be passed in when already collected (see _collect_nodes).
     Returns the modified tree.
     """
-    tree = _ensure_etree(tree)
     if tree is None:
         return tree
         
+    if tables is None:
+        tables = list(tree.iter("table"))
+    if not tables:
+        return tree
+
     try:
-        for table in tree.xpath(".//table"):
+        for table in tables:
             # Check if table already has th elements
-            if table.xpath(".//th"):
+            if next(table.iter("th"), None) is not None:
                 continue
 
             # Find first tr
             first_tr = None
-            tbody_elements = table.xpath(".//tbody")
-            if tbody_elements:
-                first_tr_elements = tbody_elements[0].xpath(".//tr")
-                if first_tr_elements:
-                    first_tr = first_tr_elements[0]
+            tbody = next(table.iter("tbody"), None)
+            if tbody is not None:
+                first_tr = next(tbody.iter("tr"), None)
             
             if first_tr is None:
-                first_tr_elements = table.xpath(".//tr")
-                if first_tr_elements:
-                    first_tr = first_tr_elements[0]
+                first_tr = next(table.iter("tr"), None)
                     
             if first_tr is None:
                 continue
 
-            # Get cells from first row
-            cells = first_tr.xpath(".//td | .//th")
+            # Promote the row in place: its cells become <th> and the row itself moves into a new
+            # <thead> at the top of the table, so no cell content or attributes are copied
+            cells = list(first_tr.iterchildren("td", "th"))
             if not cells:
                 continue
+            for cell in cells:
+                cell.tag = "th"
 
-            # Create thead element
             thead = etree.Element("thead")
-            tr_head = etree.Element("tr")
-            
-            for cell in cells:
-                th = etree.Element("th")
-                # Copy all content from cell to th
-                th.text = cell.text
-                th.tail = cell.tail
-                for child in cell:
-                    th.append(child)
-                # Copy attributes
-                for key, value in cell.attrib.items():
-                    th.set(key, value)
-                tr_head.append(th)
-                
-            thead.append(tr_head)
-            
-            # Insert thead at the beginning of table
             table.insert(0, thead)
-            
-            # Remove the original first row
-            parent = first_tr.getparent()
-            if parent is not None:
-                parent.remove(first_tr)
+            # append() detaches the row from its tbody/table first
+            thead.append(first_tr)
 
         return tree
     except Exception as e:
@@ -453,43 +701,45 @@ def normalize_tables_use_first_row_as_header(tree):
         return tree
 
 
-def remove_page_header_footer_repeats(tree, min_repeat: int = 3, max_header_text_len: int = 200):
+def remove_page_header_footer_repeats(tree: etree._Element, min_repeat: int = 3, max_header_text_len: int = 200, pages: Optional[list] = None):
     """
     Detect repeated short blocks at the start or end of per-page containers using lxml.
+    `pages` may be passed in when already collected (see _collect_nodes).
     Returns the modified tree.
     """
-    tree = _ensure_etree(tree)
     if tree is None:
         return tree
         
     try:
         # Find page elements - look for elements with class containing 'page'
-        pages = tree.xpath(".//*[contains(@class, 'page')]")
+        if pages is None:
+            pages = _XP_PAGE(tree)
         if not pages:
             return tree
 
+        texts = {}
         first_texts = []
         last_texts = []
         page_tags = []
         
         for page in pages:
             # Find all text-bearing elements in this page
-            tags = page.xpath(".//p | .//div | .//h1 | .//h2 | .//h3 | .//h4 | .//h5 | .//h6 | .//span")
+            tags = list(page.iterdescendants(*_PAGE_TEXT_TAGS))
             
             first_txt = ""
             last_txt = ""
             
-            # Find first meaningful text
+            # Find first meaningful text (texts longer than max_header_text_len come back empty)
             for tag in tags:
-                txt = _normalize_text(_get_text_content(tag))
-                if txt and len(txt) <= max_header_text_len:
+                txt = _cached_bounded_text(tag, texts, max_header_text_len)
+                if txt:
                     first_txt = txt
                     break
                     
             # Find last meaningful text
             for tag in reversed(tags):
-                txt = _normalize_text(_get_text_content(tag))
-                if txt and len(txt) <= max_header_text_len:
+                txt = _cached_bounded_text(tag, texts, max_header_text_len)
+                if txt:
                     last_txt = txt
                     break
                     
@@ -506,21 +756,14 @@ def remove_page_header_footer_repeats(tree, min_repeat: int = 3, max_header_text
         if not f_repeated and not l_repeated:
             return tree
 
-        # Remove repeated elements
+        # Collect repeated elements, then remove them together; decisions use the texts as parsed
+        targets = []
         for page, tags in page_tags:
             for tag in tags:
-                try:
-                    txt = _normalize_text(_get_text_content(tag))
-                except Exception:
-                    continue
-                    
+                txt = _cached_bounded_text(tag, texts, max_header_text_len)
                 if txt in f_repeated or txt in l_repeated:
-                    try:
-                        parent = tag.getparent()
-                        if parent is not None:
-                            parent.remove(tag)
-                    except Exception:
-                        pass
+                    targets.append(tag)
+        _detach_all(targets)
 
         logger.warning("removed repeated page headers/footers: headers=%s footers=%s", list(f_repeated), list(l_repeated))
         return tree
@@ -529,174 +772,393 @@ def remove_page_header_footer_repeats(tree, min_repeat: int = 3, max_header_text
         return tree
 
 
-def etree_to_markdown(tree) -> str:
+def _md_text(elem, write):
+    text = elem.text
+    if text:
+        text = text.strip()
+        if text:
+            write(text)
+
+
+def _md_heading(level: int):
+    marker = "\n" + "#" * level + " "
+
+    def start(elem, write, stack):
+        write(marker)
+        _md_text(elem, write)
+    return start
+
+
+def _md_start_p(elem, write, stack):
+    write("\n")
+    _md_text(elem, write)
+
+
+def _md_emphasis(marker: str):
+    def start(elem, write, stack):
+        write(marker)
+        stack.append(marker)
+        _md_text(elem, write)
+    return start
+
+
+def _md_start_a(elem, write, stack):
+    write("[")
+    stack.append(("a", elem.get("href", "")))
+    _md_text(elem, write)
+
+
+def _md_start_img(elem, write, stack):
+    alt = elem.get("alt", "")
+    src = elem.get("src", "")
+    write(f"![{alt}]({src})")
+
+
+def _md_list(kind: str):
+    def start(elem, write, stack):
+        # push list context
+        stack.append(kind)
+    return start
+
+
+def _md_start_li(elem, write, stack):
+    # numeric lists are kept simple as '-' to avoid expensive index calculations
+    write("\n- ")
+    _md_text(elem, write)
+
+
+def _md_start_br(elem, write, stack):
+    write("\n")
+
+
+def _md_start_pre(elem, write, stack):
+    write("\n```\n")
+    if elem.text:
+        write(elem.text)
+
+
+def _md_end_emphasis(elem, write, stack):
+    # pop matching formatter if present
+    if stack:
+        top = stack.pop()
+        write(top if isinstance(top, str) else "")
+
+
+def _md_end_a(elem, write, stack):
+    if stack:
+        top = stack.pop()
+        if isinstance(top, tuple) and top[0] == "a":
+            write(f"]({top[1]})")
+
+
+def _md_end_list(elem, write, stack):
+    # pop list context if present
+    if stack and stack[-1] in ("ul", "ol"):
+        stack.pop()
+    write("\n")
+
+
+def _md_end_pre(elem, write, stack):
+    write("\n```\n\n")
+
+
+# per-tag handlers for etree_to_markdown, called as handler(elem, write, stack); tags without a
+# start handler write their own text, tags without an end handler only write their tail
+_MD_START = {
+    "h1": _md_heading(1), "h2": _md_heading(2), "h3": _md_heading(3),
+    "h4": _md_heading(4), "h5": _md_heading(5), "h6": _md_heading(6),
+    "p": _md_start_p,
+    "strong": _md_emphasis("**"), "b": _md_emphasis("**"),
+    "em": _md_emphasis("*"), "i": _md_emphasis("*"),
+    "a": _md_start_a,
+    "img": _md_start_img,
+    "ul": _md_list("ul"), "ol": _md_list("ol"),
+    "li": _md_start_li,
+    "br": _md_start_br,
+    "pre": _md_start_pre,
+}
+_MD_END = {
+    "strong": _md_end_emphasis, "b": _md_end_emphasis, "em": _md_end_emphasis, "i": _md_end_emphasis,
+    "a": _md_end_a,
+    "ul": _md_end_list, "ol": _md_end_list,
+    "pre": _md_end_pre,
+}
+
+
+# lowercased local names keyed by raw elem.tag; HTML has a small tag vocabulary, so this stays tiny
+# (bounded by _LOCALNAME_CACHE_MAX against documents inventing tag names)
+_LOCALNAME_CACHE: Dict[str, str] = {}
+_LOCALNAME_CACHE_MAX = 1024
+
+# subtrees that never contribute to the markdown; etree_to_markdown skips them without visiting their children
+_MD_SKIP = frozenset(("head", "script", "style", "svg", "noscript", "template"))
+
+
+def etree_to_markdown(tree: etree._Element, consume: bool = False) -> str:
     """
     High-performance conversion from lxml etree to markdown using iterwalk (event-driven).
     Replaces recursive _process_element to avoid truncation issues on large/heterogeneous trees.
+    With consume=True, elements are cleared and detached as soon as they are written, so the tree's
+    memory is released during the walk; the tree is left empty and must not be used afterwards.
     """
     if tree is None:
         return ""
 
-    output = StringIO()
-
-    # safe localname extraction (handles namespaces)
-    def _localname(elem):
-        try:
-            return etree.QName(elem).localname.lower()
-        except Exception:
-            # fallback if QName fails
-            tag = getattr(elem, "tag", "")
-            return (tag or "").split("}")[-1].lower() if isinstance(tag, str) else ""
+    # pieces are collected in a list and joined once; runs of 3+ newlines are capped to 2 as they are
+    # written (this used to be a regex pass over the whole output), tracking the trailing run across writes
+    parts = []
+    append = parts.append
+    nl_run = 0
+
+    def write(s):
+        nonlocal nl_run
+        if "\n" not in s:
+            if s:
+                append(s)
+                nl_run = 0
+            return
+        if "\n\n\n" in s:
+            s = _BLANK_LINES_RE.sub("\n\n", s)
+        lead = len(s) - len(s.lstrip("\n"))
+        if nl_run + lead > 2:
+            s = s[nl_run + lead - 2:]
+        rest = s.rstrip("\n")
+        nl_run = nl_run + len(s) if not rest else len(s) - len(rest)
+        append(s)
 
     # stack to track open formatting/list context
     stack = []
-
-    for event, elem in etree.iterwalk(tree, events=("start", "end")):
-        # skip comments / PIs / non-elements
-        if not isinstance(elem.tag, str):
-            continue
-
-        tag = _localname(elem)
+    start_handlers = _MD_START
+    end_handlers = _MD_END
+    skip_tags = _MD_SKIP
+    localnames = _LOCALNAME_CACHE
+
+    # tag="*" yields elements only, so comments and PIs are filtered out in C
+    walker = etree.iterwalk(tree, events=("start", "end"), tag="*")
+    for event, elem in walker:
+        raw = elem.tag
+        tag = localnames.get(raw)
+        if tag is None:
+            # local name without building a QName; namespaced tags are "{uri}name"
+            tag = raw.rpartition("}")[2].lower()
+            if len(localnames) < _LOCALNAME_CACHE_MAX:
+                localnames[raw] = tag
 
         if event == "start":
-            # headings
-            if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
-                level = int(tag[1])
-                output.write("\n" + "#" * level + " ")
-                if elem.text and elem.text.strip():
-                    output.write(elem.text.strip())
-            elif tag == "p":
-                output.write("\n")
-                if elem.text and elem.text.strip():
-                    output.write(elem.text.strip())
-            elif tag in ("strong", "b"):
-                output.write("**")
-                stack.append("**")
-                if elem.text and elem.text.strip():
-                    output.write(elem.text.strip())
-            elif tag in ("em", "i"):
-                output.write("*")
-                stack.append("*")
-                if elem.text and elem.text.strip():
-                    output.write(elem.text.strip())
-            elif tag == "a":
-                href = elem.get("href", "")
-                output.write("[")
-                stack.append(("a", href))
-                if elem.text and elem.text.strip():
-                    output.write(elem.text.strip())
-            elif tag == "img":
-                alt = elem.get("alt", "")
-                src = elem.get("src", "")
-                output.write(f"![{alt}]({src})")
-            elif tag in ("ul", "ol"):
-                stack.append(tag)  # push list context
-            elif tag == "li":
-                # find nearest list context
-                list_type = next((t for t in reversed(stack) if t in ("ul", "ol")), "ul")
-                if list_type == "ul":
-                    output.write("\n- ")
-                else:
-                    # keep numeric lists simple as '-' to avoid expensive index calculations
-                    output.write("\n- ")
-                if elem.text and elem.text.strip():
-                    output.write(elem.text.strip())
-            elif tag == "br":
-                output.write("\n")
-            elif tag == "pre":
-                output.write("\n```\n")
-                if elem.text:
-                    output.write(elem.text)
+            if tag in skip_tags:
+                # the end event still follows, so the element's tail is written as usual
+                walker.skip_subtree()
+                continue
+            handler = start_handlers.get(tag)
+            if handler is not None:
+                handler(elem, write, stack)
             else:
                 # default: write element.text if present
-                if elem.text and elem.text.strip():
-                    output.write(elem.text.strip())
+                _md_text(elem, write)
 
         else:  # event == "end"
-            if tag in ("strong", "b", "em", "i"):
-                # pop matching formatter if present
-                if stack:
-                    top = stack.pop()
-                    output.write(top if isinstance(top, str) else "")
-            elif tag == "a":
-                if stack:
-                    top = stack.pop()
-                    if isinstance(top, tuple) and top[0] == "a":
-                        href = top[1]
-                        output.write(f"]({href})")
-            elif tag in ("ul", "ol"):
-                # pop list context if present
-                if stack and stack[-1] in ("ul", "ol"):
-                    stack.pop()
-                output.write("\n")
-            elif tag == "pre":
-                output.write("\n```\n\n")
+            handler = end_handlers.get(tag)
+            if handler is not None:
+                handler(elem, write, stack)
 
             # always handle tail text
-            if elem.tail and elem.tail.strip():
-                output.write(" " + elem.tail.strip())
+            tail = elem.tail
+            if tail:
+                tail = tail.strip()
+                if tail:
+                    write(" " + tail)
+
+            if consume:
+                # this element and everything before it are written: detach its earlier siblings,
+                # which frees their subtrees (the walk only keeps hold of ancestors and what follows);
+                # each end event leaves at most the one sibling before it behind
+                # the root has no parent, but may have sibling comments/PIs from other parsers
+                parent = elem.getparent()
+                if parent is not None:
+                    prev = elem.getprevious()
+                    while prev is not None:
+                        parent.remove(prev)
+                        prev = elem.getprevious()
+
+    # trim the result by trimming its outermost non-blank pieces; strip() on the joined string would
+    # copy the whole output once more
+    start, end = 0, len(parts)
+    while start < end and (not parts[start] or parts[start].isspace()):
+        start += 1
+    while end > start and (not parts[end - 1] or parts[end - 1].isspace()):
+        end -= 1
+    if start == end:
+        return ""
+    parts[start] = parts[start].lstrip()
+    parts[end - 1] = parts[end - 1].rstrip()
+    return "".join(parts[start:end])
+
+
+def _collect_nodes(tree: etree._Element):
+    """
+    Collect the nodes the tree stages start from in one document-order walk.
+    Returns (pages, tables, imgs, packages): the elements matched by _XP_PAGE, <table>s, <img>s
+    and the elements matched by _XP_PACKAGE.
+    """
+    pages = []
+    tables = []
+    imgs = []
+    packages = []
+    for el in tree.iter("*"):
+        tag = el.tag
+        if tag == "img":
+            imgs.append(el)
+        elif tag == "table":
+            tables.append(el)
+        cls = el.get("class")
+        if not cls or el is tree:
+            continue
+        # substring tests first; only then split into class tokens (matches _XP_PAGE/_XP_PACKAGE)
+        if "page" in cls or "package-entry" in cls:
+            tokens = cls.split()
+            if "page" in tokens:
+                pages.append(el)
+            if "package-entry" in tokens:
+                packages.append(el)
+    return pages, tables, imgs, packages
 
-    result = output.getvalue()
-    result = re.sub(r"\n{3,}", "\n\n", result)
-    result = result.strip()
-    return result
 
+def _count_elements(tree) -> int:
+    return sum(1 for _ in tree.iter()) if tree is not None else 0
 
-@app.post("/", response_class=PlainTextResponse)
-async def parse_file(file: UploadFile = File(...)):
+
+def _transform_pipeline(tree: etree._Element, min_repeat: int = 3, start_time: float = 0.0) -> str:
     """
-    Accept a multipart form file under 'file', call external Tika server to get HTML and attachments.
-    Returns Markdown (text/markdown).
-    High-performance implementation using lxml for HTML processing and direct etree-to-markdown conversion.
+    Run all tree stages and the markdown conversion back to back.
+    Synchronous on purpose: parse_file dispatches it (via _html_to_markdown) to a worker thread once
+    instead of once per stage.
+    start_time is a time.monotonic() value (the event loop clock) used for debug timings.
+    """
+    # stage stats are only computed when debug logging is on; counting elements is O(n) but far
+    # cheaper than serializing the tree just to measure its length
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    # one walk collects the entry points of the stages below instead of each stage searching the tree;
+    # nodes detached by an earlier stage are left out of the output regardless
+    pages, tables, imgs, packages = _collect_nodes(tree)
+
+    tree = remove_page_header_footer_repeats(tree, min_repeat=min_repeat, pages=pages)
+    if debug:
+        logger.debug("After remove_page_header_footer_repeats: elements=%d, took %.3f seconds", _count_elements(tree), time.monotonic() - start_time)
+
+    # normalize tables: use first row as header if no <th> exists
+    tree = normalize_tables_use_first_row_as_header(tree, tables=tables)
+    if debug:
+        logger.debug("After normalize_tables_use_first_row_as_header: elements=%d, took %.3f seconds", _count_elements(tree), time.monotonic() - start_time)
+
+    # process img tags to generate alt text
+    tree = inline_images_in_html(tree, imgs=imgs)   # only generate alt text
+    if debug:
+        logger.debug("After inline_images_in_html: elements=%d, took %.3f seconds", _count_elements(tree), time.monotonic() - start_time)
+
+    # unified removal of attachments/headers/tail filename lists
+    tree = remove_non_content_blocks(tree, packages=packages)
+    if debug:
+        logger.debug("After remove_non_content_blocks: elements=%d, took %.3f seconds", _count_elements(tree), time.monotonic() - start_time)
+
+    # convert etree -> Markdown using high-performance direct traversal; the tree is not needed
+    # afterwards, so let the conversion free it as it goes
+    return etree_to_markdown(tree, consume=True)
+
+
+def _html_to_markdown(html: str, min_repeat: int = 3, start_time: float = 0.0) -> str:
+    """
+    Sanitize and parse Tika's HTML, then run _transform_pipeline on the tree.
+    parse_file runs this as its one worker-thread job, so parsing and the tree stages are handed off
+    together rather than in two round trips through the executor.
+    """
+    tree = sanitize_html(html)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("After sanitize_html: elements=%d, took %.3f seconds", _count_elements(tree), time.monotonic() - start_time)
+    return _transform_pipeline(tree, min_repeat, start_time)
+
+
+async def parse_one(request: Request, file: UploadFile) -> str:
+    """
+    Convert one uploaded file to Markdown: result cache, Tika /rmeta, then the tree pipeline.
+    Raises HTTPException for an empty upload (400) or a failed Tika call (502).
+    Shared by the single-file and batch endpoints.
     """
     start_time = asyncio.get_event_loop().time()
     logger.debug("Starting request processing %r", start_time)
-    body = await file.read()
-    if not body:
+    # the upload is already spooled by Starlette; hash it in chunks and stream it to Tika below
+    # rather than reading it into one bytes object
+    cache_key, size = await _hash_upload(file)
+    if not size:
         raise HTTPException(status_code=400, detail="empty file")
 
-    logger.debug("Received file: filename=%s content_type=%s size=%d", file.filename, file.content_type, len(body))
+    logger.debug("Received file: filename=%s content_type=%s size=%d", file.filename, file.content_type, size)
     logger.debug("Reading file took %.3f seconds", asyncio.get_event_loop().time() - start_time)
 
-    async with httpx.AsyncClient() as client:
-        try:
-            # Use /rmeta to obtain the main document content and embedded records.
-            html, page_size, embedded_records = await fetch_rmeta(client, body)
-        except Exception as e:
-            logger.exception("failed to fetch rmeta from Tika")
-            raise HTTPException(status_code=502, detail=f"tika /rmeta error: {e}")
-        logger.debug("Fetched rmeta: main content length=%d, embedded records=%d", len(html) if html else 0, len(embedded_records) if embedded_records else 0)
-        logger.debug("Fetching rmeta took %.3f seconds", asyncio.get_event_loop().time() - start_time)
-
-        # parse once into lxml etree and reuse
-        tree = sanitize_html(html)
-
-        # remove repeated per-page headers/footers emitted by Tika (e.g. <div class="page"> chunks)
-        min_repeat = max(3, page_size // 2) if page_size and page_size > 0 else 3
-        tree = await asyncio.to_thread(remove_page_header_footer_repeats, tree, min_repeat=min_repeat)
-
-        logger.debug("After remove_page_header_footer_repeats: content length=%d", len(etree.tostring(tree, encoding='unicode')) if tree is not None else 0)
-        logger.debug("Processing remove_page_header_footer_repeats took %.3f seconds", asyncio.get_event_loop().time() - start_time)
-
-        # normalize tables: use first row as header if no <th> exists
-        tree = await asyncio.to_thread(normalize_tables_use_first_row_as_header, tree)
-
-        logger.debug("After normalize_tables_use_first_row_as_header: content length=%d", len(etree.tostring(tree, encoding='unicode')) if tree is not None else 0)
-        logger.debug("Processing normalize_tables_use_first_row_as_header took %.3f seconds", asyncio.get_event_loop().time() - start_time)
-
-        # process img tags to generate alt text
-        tree = await asyncio.to_thread(inline_images_in_html, tree)   # only generate alt text
-        logger.debug("After inline_images_in_html: content length=%d, attachments inlined=%d", len(etree.tostring(tree, encoding='unicode')) if tree is not None else 0, len(embedded_records) if embedded_records else 0)
-        logger.debug("Processing inline_images_in_html took %.3f seconds", asyncio.get_event_loop().time() - start_time)
-
-        # unified removal of attachments/headers/tail filename lists
-        tree = await asyncio.to_thread(remove_non_content_blocks, tree)
-        logger.debug("After remove_non_content_blocks: content length=%d", len(etree.tostring(tree, encoding='unicode')) if tree is not None else 0)
-        logger.debug("Processing remove_non_content_blocks took %.3f seconds", asyncio.get_event_loop().time() - start_time)
-
-        # convert etree -> Markdown using high-performance direct traversal
-        markdown = await asyncio.to_thread(etree_to_markdown, tree)
-        logger.debug("Converted to markdown: length=%d", len(markdown) if markdown else 0)
-        logger.debug("Total processing took %.3f seconds", asyncio.get_event_loop().time() - start_time)
-
-        return PlainTextResponse(content=markdown, media_type="text/markdown; charset=utf-8")
\ No newline at end of file
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        logger.debug("Result cache hit: length=%d", len(cached))
+        return cached
+
+    client = request.app.state.tika_client
+    try:
+        # Use /rmeta to obtain the main document content and embedded records.
+        async with request.app.state.tika_semaphore:
+            html, page_size, embedded_records = await fetch_rmeta(client, _iter_upload(file), content_length=size)
+    except Exception as e:
+        logger.exception("failed to fetch rmeta from Tika")
+        raise HTTPException(status_code=502, detail=f"tika /rmeta error: {e}")
+    logger.debug("Fetched rmeta: main content length=%d, embedded records=%d", len(html) if html else 0, len(embedded_records) if embedded_records else 0)
+    logger.debug("Fetching rmeta took %.3f seconds", asyncio.get_event_loop().time() - start_time)
+
+    if html is None:
+        # unusable Tika response; don't cache it, so a retry of the same file asks Tika again
+        return ""
+    if not html or html.isspace():
+        # nothing to transform; skip parsing and every tree stage
+        _cache_put(cache_key, "")
+        return ""
+
+    # remove repeated per-page headers/footers emitted by Tika (e.g. <div class="page"> chunks)
+    min_repeat = max(3, page_size // 2) if page_size and page_size > 0 else 3
+
+    # parse once into lxml etree, then run every tree stage plus markdown conversion, all in a single
+    # worker thread; regex scrubbing, parsing and the stages are CPU-bound, keep them off the loop
+    markdown = await asyncio.to_thread(_html_to_markdown, html, min_repeat, start_time)
+    logger.debug("Converted to markdown: length=%d", len(markdown) if markdown else 0)
+    logger.debug("Total processing took %.3f seconds", asyncio.get_event_loop().time() - start_time)
+
+    _cache_put(cache_key, markdown)
+    return markdown
+
+
+@app.post("/", response_class=PlainTextResponse)
+async def parse_file(request: Request, file: UploadFile = File(...)):
+    """
+    Accept a multipart form file under 'file', call external Tika server to get HTML and attachments.
+    Returns Markdown (text/markdown).
+    High-performance implementation using lxml for HTML processing and direct etree-to-markdown conversion.
+    """
+    markdown = await parse_one(request, file)
+    return PlainTextResponse(content=markdown, media_type="text/markdown; charset=utf-8")
+
+
+@app.post("/batch")
+async def parse_batch(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Accept several multipart files under 'files' and convert them concurrently.
+    Returns a JSON list in upload order: {"filename", "markdown"} per converted file, or
+    {"filename", "status", "error"} for a file that was rejected or that Tika failed on.
+    Tika calls across the batch (and other requests) stay bounded by MAX_INFLIGHT.
+    """
+    results = await asyncio.gather(*(parse_one(request, f) for f in files), return_exceptions=True)
+    out = []
+    for f, result in zip(files, results):
+        if isinstance(result, HTTPException):
+            out.append({"filename": f.filename, "status": result.status_code, "error": result.detail})
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            out.append({"filename": f.filename, "markdown": result})
+    # orjson is already a dependency for /rmeta decoding; serialize with it directly
+    return Response(content=orjson.dumps(out), media_type="application/json")
\ No newline at end of file